@@ -46,17 +46,37 @@ Description: Verify controller information
  -----------------------------------------------------------------------------
 """
 
-import time
+import hashlib
+import os
 
 from sal.mradapter import create_mradapter
 from sal.testscript import TestScript, arg
 from sal.storelib_defines import KB, GB
 from sal.common import SALError
+from script_helpers import ScriptHelpers
 
 
-class SalTestCase(TestScript):
+class SalTestCase(ScriptHelpers, TestScript):
 
     """STORELIB -GetControllerInfo"""
+    RESOURCES = {'pd_count': 4, 'enclosures': 1}
+    # the shared CTRL_PROP_CHECKS plus the rebuild/bgi/cc/pr/recon rates
+    CTRL_PROP_CHECKS = ScriptHelpers.CTRL_PROP_CHECKS + [
+        ('bgiRate', 'bgi_rate_current', str, lambda v: v),
+        ('ccRate', 'check_consistency_rate_current', str, lambda v: v),
+        ('patrolReadRate', 'pr_rate_current', str, lambda v: v),
+        ('rebuildRate', 'rebuild_rate_current', str, lambda v: v),
+        ('reconRate', 'reconstruction_rate_current', str, lambda v: v)]
+    # SL driver info vs CLI controller property checks, same layout as
+    # CTRL_PROP_CHECKS
+    DRIVER_CHECKS = [
+        ('version', 'driver_version', lambda v: v.strip(), lambda v: v),
+        ('name', 'driver_name', lambda v: v.upper(), lambda v: v.upper())]
+    # (controller capability group, title to log it under)
+    CAPABILITY_GROUPS = [('cluster', 'cluster'),
+                         ('raidLevels', 'raid level'),
+                         ('adapterOperations', 'adapter operation'),
+                         ('pdMixSupport', 'pd/ld mix')]
     REQ_ARGS = [arg("--ctrl", dest="ctrl", type="int", help="ctrl ID number"),
                 arg("--new_fw_path", dest="new_fw_path", type="str",
                     help="New Firmware Path")]
@@ -75,6 +95,23 @@ class SalTestCase(TestScript):
         """ Clean up VDs and PDs on a failure """
         self.mr.restore_pretest(pretest=self.pretest_info)
 
+    def image_md5(self, path, chunk_size=1024 * 1024):
+        """ md5 of a firmware image, read in chunks """
+        md5 = hashlib.md5()
+        with open(path, 'rb') as image:
+            for chunk in iter(lambda: image.read(chunk_size), b''):
+                md5.update(chunk)
+        return md5.hexdigest()
+
+    def parse_pd_cli_info(self, info):
+        """ Convert the cli pd info strings once into the values step2
+        compares: size in GB and the SAS address of each port, without the
+        0X prefix ('' when the port has no address) """
+        return {'size_gb': int(int(info['size']) / KB),  # MB into GB
+                'sas_addresses': [
+                    info[key].replace('0X', '') if len(info[key]) > 3
+                    else '' for key in ('sas_address_0', 'sas_address_1')]}
+
     def step1(self):
         """Connect some drives to the controller w/o enclosure
         <BR>-create some logical drives
@@ -89,51 +126,34 @@ class SalTestCase(TestScript):
         <BR>-Rebuild rate, CC rate, INIT rate, Reconstruction rate....etc"""
         int_fw_val = self.mr.firmware_version
         self.log.info("Current FW version: %s" % int_fw_val)
-        self.log.info("Flashing firmware: %s" % (self.args.new_fw_path))
+        if not os.path.isfile(self.args.new_fw_path):
+            raise SALError("Firmware image not found: %s"
+                           % (self.args.new_fw_path))
+        self.log.info("Flashing firmware: %s (%d bytes, md5: %s)"
+                      % (self.args.new_fw_path,
+                         os.path.getsize(self.args.new_fw_path),
+                         self.image_md5(self.args.new_fw_path)))
         self.mr.flash_file(firmware_filename=self.args.new_fw_path)
-        time.sleep(240)  # sleep for 4m
-        post_fw_val = self.mr.firmware_version
-        if int_fw_val == post_fw_val:
+        # wait up to 4m for the controller to come back with the new FW
+        if not self.wait_until(
+                "new FW version on controller: %d" % (self.args.ctrl),
+                lambda: self.mr.firmware_version != int_fw_val, timeout=240):
             raise SALError("Failed to change firmware version!")
         else:
             self.log.info("FW  Flashed successfully")
-            self.log.info("New FW version: %s" % post_fw_val)
-
-        # get controller properties from sl and cli
-        ctrl_prop_sl = self.mr.get_ctrl_property()
-        ctrl_prop_cli = self.mr.cli.get_all()
-
-        if ctrl_prop_sl['BIOS'].upper() != ctrl_prop_cli['bios_version'].upper():
-            raise SALError("Failed to match bios_version!")
-        else:
-            self.log.info("bios_version: %s" % ctrl_prop_sl['BIOS'])
+            self.log.info("New FW version: %s" % self.mr.firmware_version)
 
+        # get controller properties from sl and cli, validate them together
+        (ctrl_prop_sl, ctrl_prop_cli) = self.get_ctrl_props()
         drv_info = self.mr.get_driver_version()  # get driver info from sl
-        if drv_info['version'].strip() != ctrl_prop_cli['driver_version']:
-            raise SALError("Failed to match driver_version!")
-        else:
-            self.log.info("driver_version: %s" % drv_info['version'].strip())
-
-        if drv_info['name'].upper() != ctrl_prop_cli['driver_name'].upper():
-            raise SALError("Failed to match driver_name!")
-        else:
-            self.log.info("driver_name: %s" % drv_info['name'])
-
-        keys_sl = ['pci_subDevId', 'pci_subVendorId', 'pci_vendorId']
-        keys_cli = ['subdevice_id', 'subvendor_id', 'vendor_id']
-
-        self.log.info("*****Display details about devieID, etc*****")
-        for (key1, key2) in zip(keys_sl, keys_cli):
-            # convert hex to decimal and then str to compare with SL values
-            if ctrl_prop_sl[key1] != str(int(ctrl_prop_cli[key2], 16)):
-                raise SALError("Failed to match %s" % key1)
-            else:
-                self.log.info("%s : %s" % (key1, ctrl_prop_sl[key1]))
-
-        if ctrl_prop_sl['productName'].upper() != ctrl_prop_cli['model'].upper():
-            raise SALError("Failed to match product name!")
-        else:
-            self.log.info("Product name: %s" % ctrl_prop_sl['productName'])
+        self.log.info("*****Cross check SL and CLI controller info*****")
+        mismatches = self.cross_check(self.CTRL_PROP_CHECKS, ctrl_prop_sl,
+                                      ctrl_prop_cli)
+        mismatches.extend(self.cross_check(self.DRIVER_CHECKS, drv_info,
+                                           ctrl_prop_cli))
+        if mismatches:
+            raise SALError("Failed to match %s" % ", ".join(
+                "%s (sl: %s, cli: %s)" % mismatch for mismatch in mismatches))
 
         self.log.info("alarmEnable: %s" % ctrl_prop_sl['alarmEnable'])
         self.log.info("memorySize: %s" % ctrl_prop_sl['memorySize'])
@@ -152,9 +172,11 @@ class SalTestCase(TestScript):
             self.log.info("PD's count on backplane: %d" % len(pds_bp))
         self.vds = self.mr.add_vd(raid=0, absolute_space="10GB",
                                   pd_list=pds_bp, vd_count=2)
-        for vd in self.vds:
-            while vd.fgi_running:
-                time.sleep(6)  # fgi is still running, sleep for 6 sec
+        # fgi is still running, poll every 6 sec for up to 1h
+        self.wait_all_done("FGI on controller: %d" % (self.args.ctrl),
+                           self.vds, is_running=lambda vd: vd.fgi_running,
+                           timeout=3600, describe=lambda vd: "VD %d" % vd.id,
+                           poll=6)
         for vd in self.vds:
             if vd.get_state() != 3:  # Optimal
                 raise SALError("The VD failed to be created optimal!")
@@ -188,39 +210,13 @@ class SalTestCase(TestScript):
             self.log.info("ldOfflineCount: %d" %
                           ctrl_health['ldOfflineCount'])
 
-        # Display the cluster information
-        self.log.info("*****Display cluster information*****")
-        cluster_info = self.mr.get_controller_capabilities(
-            group_name='cluster')
-        for k, v in iter(sorted(cluster_info.iteritems())):
-            self.log.info("%s : %s" % (k, v))
-
-        rl_s = self.mr.get_controller_capabilities(group_name='raidLevels')
-        for k, v in iter(sorted(rl_s.iteritems())):
-            self.log.info("%s : %s" % (k, v))
-
-        self.log.info("*****Display adapter operation information*****")
-        adp_op = self.mr.get_controller_capabilities(
-            group_name='adapterOperations')
-        for k, v in iter(sorted(adp_op.iteritems())):
-            self.log.info("%s : %s" % (k, v))
-
-        self.log.info("*****Display pd/ld mix information*****")
-        pd_mix = self.mr.get_controller_capabilities(group_name='pdMixSupport')
-        for k, v in iter(sorted(pd_mix.iteritems())):
-            self.log.info("%s : %s" % (k, v))
-
-        self.log.info("*****Display Rates information*****")
-        rates_sl = ['bgiRate', 'ccRate', 'patrolReadRate', 'rebuildRate',
-                    'reconRate']
-        rates_cl = ['bgi_rate_current', 'check_consistency_rate_current',
-                    'pr_rate_current', 'rebuild_rate_current',
-                    'reconstruction_rate_current']
-        for (key1, key2) in zip(rates_sl, rates_cl):
-            if str(ctrl_prop_sl[key1]) != ctrl_prop_cli[key2]:
-                raise SALError("Failed to match %s" % key1)
-            else:
-                self.log.info("%s: %d" % (key1, ctrl_prop_sl[key1]))
+        # Display the cluster, raid level, adapter operation and pd/ld mix
+        # information
+        for (group, title) in self.CAPABILITY_GROUPS:
+            self.log.info("*****Display %s information*****" % title)
+            caps = self.mr.get_controller_capabilities(group_name=group)
+            for k, v in iter(sorted(caps.iteritems())):
+                self.log.info("%s : %s" % (k, v))
 
     def step2(self):
         """ Connect an enclosure with some drives within enclosure.
@@ -239,10 +235,16 @@ class SalTestCase(TestScript):
         ctrl_prop_cli = self.mr.cli.get_all()  # get controller properties through cli
         self.log.info("sas_address: %s" % ctrl_prop_cli['sas_address'])
         pds = self.mr.get_all_pds(encl_id=encls_ids_sl[0])
+        # one enumeration for the SAS drives instead of a cli call per PD
+        sas_pd_ids = set(pd.id for pd in
+                         self.mr.get_all_pds(encl_id=encls_ids_sl[0],
+                                             is_sas=True))
         for pd in pds:
-            pd_c = pd.get_info()['enclDeviceId'] + ':' + str(pd.slotNumber)
+            pd_info = pd.get_info()  # one storelib round trip per PD
+            pd_c = pd_info['enclDeviceId'] + ':' + str(pd.slotNumber)
             info = self.mr.cli.pd_get_info(pd_string=pd_c)
-            pd_size1 = int(int(info['size']) / KB)  # convert MB into GB
+            cli_vals = self.parse_pd_cli_info(info)
+            pd_size1 = cli_vals['size_gb']
             pd_size2 = int(pd.size / GB)  # convert pd size bytes into GB
             size = abs(pd_size1 - pd_size2)  # get absolute value
             if size > 2:  # if size difference more than 2GB raise salerror
@@ -256,35 +258,28 @@ class SalTestCase(TestScript):
                 self.log.info("PD: %s, Media type: %s" %
                               (pd_c, info['media_type']))
 
-            if info['media_error_count'] != pd.get_info()['mediaErrCount']:
+            if info['media_error_count'] != pd_info['mediaErrCount']:
                 raise SALError("Failed to match mediaErrCount!")
             else:
                 self.log.info("PD: %s, mediaErrCount: %s " %
                               (pd_c, info['media_error_count']))
-            if info['firmware_revision'] != pd.get_info()['revisionLevel']:
+            if info['firmware_revision'] != pd_info['revisionLevel']:
                 raise SALError("Failed to match firmwware_revision!")
             else:
                 self.log.info("PD: %s, firmware_revision: %s " %
                               (pd_c, info['firmware_revision']))
             sas_add_sl = pd.unique_id.split(':')[-1]
-            if len(info['sas_address_0']) > 3:
-                sas_add_cli = info['sas_address_0'].replace('0X', '')
-                i = 0
-            else:
-                sas_add_cli = info['sas_address_1'].replace('0X', '')
-                i = 1
+            sas_adds_cli = cli_vals['sas_addresses']
+            i = 0 if sas_adds_cli[0] else 1
+            sas_add_cli = sas_adds_cli[i]
             if sas_add_cli != sas_add_sl:
                 raise SALError("Failed to match SAS address")
             else:
                 self.log.info("PD: %s, sas_address_%s: 0X%s" %
                               (pd_c, i, sas_add_cli))
-            if self.mr.cli.pd_is_sas(pd_string=pd_c):  # if pd is SATA skip
-                if len(info['sas_address_0']) > 3:
-                    self.log.info("PD: %s, sas_address_1: %s" %
-                                  (pd_c, info['sas_address_1']))
-                else:
-                    self.log.info("PD: %s, sas_address_0: %s" %
-                                  (pd_c, info['sas_address_0']))
+            if pd.id in sas_pd_ids:  # if pd is SATA skip
+                self.log.info("PD: %s, sas_address_%s: %s" %
+                              (pd_c, 1 - i, info['sas_address_%s' % (1 - i)]))
 
         self.log.info("Delete the above created VD")
         for vd in self.vds:
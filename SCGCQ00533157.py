@@ -13,6 +13,9 @@
 # Expected Run time        : 10 minutes
 # Test Script usage Notes  : python SCGCQ00533157.py --ctrl=<ctrl_id>
 #                                                    --nocq
+#                            Optional rebuild benchmark (step5):
+#                            --rebuild_rates="30,60,100" --vd_sizes="20,100"
+#                            (rebuildRate settings, R1 VD sizes in GB)
 # Test case Description    :
  TestCaseName: STORELIB -GetPDOperationProgress
 Description: Gets the progress of ongoing operation on a physical
@@ -40,58 +43,78 @@ Description: Gets the progress of ongoing operation on a physical
  Step Expected Result: -Should have events rebuilding completed <BR>-
  The progress should update with percentage until it reachs 100%
  -----------------------------------------------------------------------------
+ Step Number: 5
+ Step Details: Optional, only with --rebuild_rates. For each VD size, create
+ a R1 and repeat offline and rebuild of one PD for each rebuildRate setting
+ Step Expected Result: Every rebuild completes <BR>-A rebuild throughput
+ (MB/s) vs rebuildRate table is logged for each VD size
+ -----------------------------------------------------------------------------
 """
 
 import time
 
 from sal.mradapter import create_mradapter
 from sal.testscript import TestScript, arg
+from sal.storelib_defines import KB, GB
 from sal.common import SALError
 from sal.mraen import (MR_EVT_LD_CREATED, MR_EVT_LD_OPTIMAL,
                        MR_EVT_LD_INIT_SUCCESSFUL, MR_EVT_PD_STATE_CHANGE,
                        MR_EVT_LD_DEGRADED, MR_EVT_PD_RBLD_START,
                        MR_EVT_PD_RBLD_DONE_PD)
+from script_helpers import ScriptHelpers
 
 
-class SalTestCase(TestScript):
+class SalTestCase(ScriptHelpers, TestScript):
 
     """ STORELIB -GetPDOperationProgress """
+    RESOURCES = {'pd_count': 5, 'interface': 'sas', 'media_type': 'hdd'}
+    VD_SIZE_GB = 20  # size of the R1 step1 creates
     REQ_ARGS = [arg("--ctrl", dest="ctrl", type="int", help="Ctrl ID number")]
+    OPT_ARGS = [arg("--rebuild_rates", dest="rebuild_rates", type="str",
+                    help="rebuildRate values to benchmark, e.g. 30,60,100"),
+                arg("--vd_sizes", dest="vd_sizes", type="str",
+                    help="R1 VD sizes in GB to benchmark (default: 20)")]
 
     def init(self):
         """ create mr adapter instance"""
         self.mr = create_mradapter(ctrl_index=self.args.ctrl, test_script=self)
+        self.init_aen_tracking()
         self.log.info("Check for UGood PD's availablity on Controller:%d"
                       % (self.args.ctrl))
-        pds = self.mr.get_all_pds(is_sas=True, state='unconfigured_good',
-                                  media_type="hdd",
-                                  is_foreign=False)
-        if len(pds) < 5:
-            raise SALError("%d UGood HDD PD's are not available for "
-                           "RAID Creation" % (5 - len(pds)))
+        pd_count = self.RESOURCES['pd_count']
+        pd_kind = "%s %s" % (self.RESOURCES['interface'].upper(),
+                             self.RESOURCES['media_type'].upper())
+        pds = self.mr.get_all_pds(
+            is_sas=self.RESOURCES['interface'] == 'sas',
+            state='unconfigured_good',
+            media_type=self.RESOURCES['media_type'], is_foreign=False)
+        if len(pds) < pd_count:
+            raise SALError("%d UGood %s PD's are not available for "
+                           "RAID Creation" % (pd_count - len(pds), pd_kind))
         else:
-            self.log.info("Number of UGood HDD PD's available is %d"
-                          % (len(pds)))
+            self.log.info("Number of UGood %s PD's available is %d"
+                          % (pd_kind, len(pds)))
 
     def teardown(self):
         """ Clean up VDs and PDs on a failure """
+        self.stop_aen_waiters()
         self.mr.restore_pretest(pretest=self.pretest_info)
 
     def step1(self):
         """ Register AEN and create R1/R5 """
         self.log.info("Registering LD Created, Optimal, Init Successfull, "
                       "PD state Change Event")
-        proc_create = self.mr.wait_for_event(
-            event_id=MR_EVT_LD_CREATED, background=True)
-        proc_optimal = self.mr.wait_for_event(
-            event_id=MR_EVT_LD_OPTIMAL, background=True)
-        proc_init = self.mr.wait_for_event(
-            event_id=MR_EVT_LD_INIT_SUCCESSFUL, background=True)
-        self.proc_state = self.mr.wait_for_event(
-            event_id=MR_EVT_PD_STATE_CHANGE, background=True)
+        proc_create = self.register_event(event_id=MR_EVT_LD_CREATED)
+        proc_optimal = self.register_event(event_id=MR_EVT_LD_OPTIMAL)
+        proc_init = self.register_event(event_id=MR_EVT_LD_INIT_SUCCESSFUL)
+        proc_state = self.register_event(event_id=MR_EVT_PD_STATE_CHANGE)
         time.sleep(30)
         self.log.info("Create RAID-1")
-        self.vd = self.mr.add_vd(raid=1, absolute_space="20GB", init_state=1)
+        self.mark_action("add_vd", proc_create, proc_optimal, proc_init,
+                         proc_state)
+        self.vd = self.mr.add_vd(raid=1,
+                                 absolute_space="%dGB" % (self.VD_SIZE_GB),
+                                 init_state=1)
         while self.vd.fgi_running:
             time.sleep(5)  # sleep for 5 sec, as fgi is still running
         if self.vd.get_state() != 3:  # Optimal
@@ -100,47 +123,49 @@ class SalTestCase(TestScript):
         else:
             self.log.info("RAID-%s VD: %d created and is in Optimal state"
                           % (self.vd.raid_level, self.vd.id))
-        if proc_create.is_alive():  # check for aen for vd create aen
-            proc_optimal.terminate()
+        # check for aen for vd create aen
+        if not self.event_found(proc_create, timeout=15):
             raise SALError("AEN for RAID-%s VD-%d created was not found"
                            % (self.vd.raid_level, self.vd.id))
         else:
             self.log.info("AEN for RAID-%s VD-%d created found"
                           % (self.vd.raid_level, self.vd.id,))
-        time.sleep(15)
-        if proc_init.is_alive():  # check for init complete aen
-            proc_init.terminate()
+        # check for init complete aen
+        if not self.event_found(proc_init, timeout=15):
             raise SALError("AEN for VD Fastinit successful was not found")
         else:
             self.log.info("AEN for Fastinit found")
 
-        if self.proc_state.is_alive():  # check for pd state change aen
+        # check for pd state change aen
+        if not self.event_found(proc_state, timeout=15):
             raise SALError("AEN for PD state change was not found")
         else:
             self.log.info("AEN for PD state change is found")
 
-        if proc_optimal.is_alive():  # check VD state optimal aen
-            proc_create.terminate()
+        # check VD state optimal aen
+        if not self.event_found(proc_optimal, timeout=15):
             raise SALError("AEN for VD Optimal was not found")
         else:
             self.log.info("AEN for VD Optimal found")
 
     def step2(self):
         """ Make one of PD offline from above created VD """
-        self.log.info("Registering LD Degraded event")
-        self.proc_deg = self.mr.wait_for_event(
-            event_id=MR_EVT_LD_DEGRADED, background=True)
+        self.log.info("Registering PD state change, LD Degraded event")
+        proc_state = self.register_event(event_id=MR_EVT_PD_STATE_CHANGE)
+        self.proc_deg = self.register_event(event_id=MR_EVT_LD_DEGRADED)
         time.sleep(10)
         self.pds = self.vd.get_pds()
+        self.mark_action("pd offline", proc_state, self.proc_deg)
         self.pds[0].state = 'offline'  # make pd offline from raid1 VD
-        time.sleep(15)
-        if self.proc_state.is_alive():  # check for pd state change aen
+        # check for pd state change aen
+        if not self.event_found(proc_state, timeout=15):
             raise SALError("AEN for PD state change was not found")
         else:
             self.log.info("AEN for PD state change is found")
             self.log.info("PD ID-%d, State: %s"
                           % (self.pds[0].id, self.pds[0].state))
-        if self.proc_deg.is_alive():  # check for VD degrade aen
+        # check for VD degrade aen
+        if not self.event_found(self.proc_deg, timeout=15):
             raise SALError("AEN for VD Degrade was not found")
         else:
             self.log.info("AEN for VD Degrade was found")
@@ -148,12 +173,13 @@ class SalTestCase(TestScript):
     def step3(self):
         """ Start a rebuild  """
         self.log.info("Registering LD Rebuild start event")
-        self.proc_rbld = self.mr.wait_for_event(
-            event_id=MR_EVT_PD_RBLD_START, pd=self.pds[0], background=True)
+        self.proc_rbld = self.register_event(
+            event_id=MR_EVT_PD_RBLD_START, pd=self.pds[0])
         time.sleep(15)
+        self.mark_action("start_rebuild", self.proc_rbld)
         self.pds[0].start_rebuild()
-        time.sleep(15)
-        if self.proc_rbld.is_alive():  # check for rebuild start aen
+        # check for rebuild start aen
+        if not self.event_found(self.proc_rbld, timeout=15):
             raise SALError("AEN for PD Rebuild was not found")
         else:
             self.log.info("AEN for PD Rebuild found")
@@ -161,25 +187,91 @@ class SalTestCase(TestScript):
     def step4(self):
         """ Monitor rebuild progress untill 100% """
         self.log.info("Registering PD Rebuild done event")
-        proc_rbld2 = self.mr.wait_for_event(
-            event_id=MR_EVT_PD_RBLD_DONE_PD, background=True)
+        proc_rbld2 = self.register_event(event_id=MR_EVT_PD_RBLD_DONE_PD)
         time.sleep(10)
-        while True:  # Monitor rebuild progress
-            prog = self.pds[0].get_progress_rebuild()
-            if prog != -1:
-                time.sleep(10)
+        # Monitor rebuild progress
+        # each R1 mirror holds the whole VD, so that is what gets rebuilt
+        for (prog, mbps, eta) in self.watch_rebuild(
+                self.pds[0], done_proc=proc_rbld2,
+                size=self.VD_SIZE_GB * GB):
+            if eta is None:
                 self.log.info("PD ID-%d, Rebuild Progress: %d"
                               % (self.pds[0].id, prog))
             else:
-                break  # break from while when rebuild is done
-        time.sleep(15)
-        if proc_rbld2.is_alive():  # check for rebuild done aen
+                self.log.info("PD ID-%d, Rebuild Progress: %d, %.1f MB/s, "
+                              "ETA: %d secs" % (self.pds[0].id, prog, mbps,
+                                                eta))
+        # check for rebuild done aen
+        if not self.event_found(proc_rbld2, timeout=15):
             raise SALError("AEN for Rebuild done didn't found!")
         else:
             self.log.info("AEN for PD Rebuild done is found")
         self.log.info("Delete the VD created in step1")
         self.vd.delete()
 
+    def step5(self):
+        """ Optional: rebuild throughput across rebuildRate settings and VD
+        sizes """
+        if self.args.rebuild_rates is None:
+            self.log.info("No --rebuild_rates given, skip rebuild benchmark")
+            return
+        rates = [int(rate) for rate in self.args.rebuild_rates.split(",")]
+        sizes = [int(size) for size in
+                 (self.args.vd_sizes or "20").split(",")]
+        orig_rate = self.mr.get_ctrl_property()['rebuildRate']
+        results = []
+        try:
+            for size in sizes:
+                self.log.info("Create RAID-1 of %dGB for rebuild benchmark"
+                              % (size))
+                vd = self.mr.add_vd(raid=1, absolute_space="%dGB" % (size),
+                                    init_state=1)
+                # wait up to 1h for FGI, polling every 5 sec
+                self.wait_all_done("FGI on RAID-1 of %dGB" % (size), [vd],
+                                   is_running=lambda vd: vd.fgi_running,
+                                   timeout=3600,
+                                   describe=lambda vd: "VD %d" % vd.id)
+                pd = vd.get_pds()[0]
+                for rate in rates:
+                    self.mr.set_ctrl_property(rebuildRate=rate)
+                    pd.state = 'offline'
+                    if not self.wait_until("PD ID-%d offline" % (pd.id),
+                                           lambda: pd.state == 'offline',
+                                           timeout=15, poll=1):
+                        raise SALError("PD ID-%d did not go offline"
+                                       % (pd.id))
+                    start = time.time()
+                    pd.start_rebuild()
+                    if not self.wait_until(
+                            "rebuild start on PD ID-%d" % (pd.id),
+                            lambda: pd.get_progress_rebuild() != -1,
+                            timeout=60, poll=1):
+                        raise SALError("Rebuild did not start on PD ID-%d"
+                                       % (pd.id))
+                    rate_mbps = None  # last MB/s from the progress samples
+                    for (prog, mbps, eta) in self.watch_rebuild(
+                            pd, size=size * GB):
+                        if eta is not None:
+                            rate_mbps = mbps
+                            self.log.info("rebuildRate %d: Rebuild Progress: "
+                                          "%d, %.1f MB/s"
+                                          % (rate, prog, mbps))
+                    secs = time.time() - start
+                    # wall clock MB/s also counts the rebuild start polling
+                    results.append((size, rate, secs, rate_mbps,
+                                    size * KB / secs))
+                vd.delete()
+        finally:
+            self.mr.set_ctrl_property(rebuildRate=orig_rate)
+        self.log.info("*****Rebuild throughput (R1)*****")
+        self.log.info("VD size GB | rebuildRate | secs | MB/s (progress) | "
+                      "MB/s (wall clock)")
+        for (size, rate, secs, rate_mbps, wall_mbps) in results:
+            self.log.info("%10d | %11d | %4d | %15s | %.1f"
+                          % (size, rate, secs,
+                             "-" if rate_mbps is None else "%.1f" % rate_mbps,
+                             wall_mbps))
+
 
 if __name__ == '__main__':
     SalTestCase().run()
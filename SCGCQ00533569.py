@@ -67,14 +67,25 @@ Step Expected Result: All boot drives show correctly.
 
 import time
 import sal.util
+from multiprocessing.pool import ThreadPool
 
 from sal.testscript import TestScript, arg
 from sal.mradapter import create_mradapter
 from sal.common import SALError
+from script_helpers import ScriptHelpers
 
 
-class SalTestCase(TestScript):
+class SalTestCase(ScriptHelpers, TestScript):
     """ Verify functionality of boot drive change"""
+    RESOURCES = {'pd_count': 10, 'interface': 'sas', 'media_type': 'hdd',
+                 'sector_size': '512B', 'per_controller': True}
+    # VDs step2 creates on every controller: R0, R1, R5 with diff properties
+    VD_SPECS = [dict(raid=0, vd_size="3000MB", WB="WB", RA='ra',
+                     cache="direct"),
+                dict(raid=1, vd_size="3000MB", WB="WT", RA='nora',
+                     cache="cached"),
+                dict(raid=5, vd_size="3000MB", WB="WB", RA='ra',
+                     cache="direct")]
     REQ_ARGS = [arg("--ctrl", dest="ctrl", type="int",
                     help="Controller index")]
     OPT_ARGS = [arg("--block_ctrl", dest="block_ctrl", type="str",
@@ -116,17 +127,42 @@ class SalTestCase(TestScript):
         for mr in self.mrs:
             mr.restore_pretest(pretest=mr.pretest_info)
 
+    def for_each_adapter(self, fn, max_workers=None):
+        """ Run fn(mr) on every controller in self.mrs concurrently and
+        return the results in the same order as self.mrs. Failures on all
+        controllers, SALError or not, are collected and raised as a single
+        SALError """
+        pool = ThreadPool(max_workers or len(self.mrs))
+        try:
+            async_res = [pool.apply_async(fn, (mr,)) for mr in self.mrs]
+            results = []
+            errors = []
+            for (mr, res) in zip(self.mrs, async_res):
+                try:
+                    results.append(res.get())
+                except Exception as err:  # keep the other controllers' errors
+                    results.append(None)
+                    errors.append("Controller-%d: %s: %s"
+                                  % (mr.ctrl_id, type(err).__name__, err))
+        finally:
+            pool.close()
+            pool.join()
+        if errors:
+            raise SALError("; ".join(errors))
+        return results
+
     def step1(self):
         """ Restore Factory Defaults"""
         self.set_value = 35
         self.default_value = 30
         self.log.info("Set CC Rate to 35 on all controllers")
-        for mr in self.mrs:
-            self.log.info("Set CC Rate on controller: %d", mr.ctrl_id)
+
+        def ccrate_set(mr):
+            self.log.info("Set CC Rate on controller: %d" % (mr.ctrl_id))
             mr.cli.ccrate_set(self.set_value)
-        init_val = []
-        for mr in self.mrs:
-            init_val.append(mr.cli.ccrate_get())
+
+        self.for_each_adapter(ccrate_set)
+        init_val = self.for_each_adapter(lambda mr: mr.cli.ccrate_get())
         self.log.info("Verify new CC Rate val on all controller")
         for (id, val) in enumerate(init_val):
             if val != self.set_value:
@@ -135,14 +171,27 @@ class SalTestCase(TestScript):
                 self.log.info("Verified CC Rate on Controller: %d : %d"
                               % (id, val))
         self.log.info("Set to factory defaults on all controllers")
-        for mr in self.mrs:
+
+        def factory_defaults_set(mr):
             self.log.info("Set to factory defaults on controller: %d, wait "
-                          "for 250 secs" % (mr.ctrl_id))
+                          "up to 250 secs" % (mr.ctrl_id))
+            pd_cnt = len(mr.get_all_pds())
             mr.cli.factory_defaults_set(restart=True)
-            time.sleep(250)
-        post_val = []
-        for mr in self.mrs:
-            post_val.append(mr.cli.ccrate_get())
+            # controller is back once the reset has replaced the CC Rate
+            # set above and it has rediscovered all its PDs. Whether the
+            # new CC Rate is the default is checked below
+            if not self.wait_until(
+                    "reset and %d PDs on controller: %d"
+                    % (pd_cnt, mr.ctrl_id),
+                    lambda: (mr.cli.ccrate_get() != self.set_value and
+                             len(mr.get_all_pds()) >= pd_cnt),
+                    timeout=250):
+                raise SALError("Controller: %d not back with its %d PDs 250 "
+                               "secs after factory defaults"
+                               % (mr.ctrl_id, pd_cnt))
+
+        self.for_each_adapter(factory_defaults_set)
+        post_val = self.for_each_adapter(lambda mr: mr.cli.ccrate_get())
         self.log.info("Verify CC Rate val on all controller after "
                       "factory defaults")
         for (id, val) in enumerate(post_val):
@@ -155,51 +204,71 @@ class SalTestCase(TestScript):
     def step2(self):
         """ Create multiple logical drives of different RAID levels with
             different properties"""
-        self.mr_vds = []
+        pd_count = self.RESOURCES['pd_count']
+        pd_kind = "%s %s" % (self.RESOURCES['interface'].upper(),
+                             self.RESOURCES['media_type'].upper())
         # Checking UGood availablity here, because after reboot cycle,
         # init will be called.
         for mr in self.mrs:
             self.log.info("Check for UGood PD's availablity on controller:%d"
                           % (mr.ctrl_id))
-            pds = mr.cli.list_all_drives(pd_type="SAS",
-                                         state="UGood", media_type="HDD",
-                                         sector_size='512B')
-            if len(pds) < 10:
-                raise SALError("%d UGood HDD PD's are not available for RAID "
+            pds = mr.cli.list_all_drives(
+                pd_type=self.RESOURCES['interface'].upper(), state="UGood",
+                media_type=self.RESOURCES['media_type'].upper(),
+                sector_size=self.RESOURCES['sector_size'])
+            if len(pds) < pd_count:
+                raise SALError("%d UGood %s PD's are not available for RAID "
                                "Creation on Controller:%d"
-                               % (10 - len(pds), mr.ctrl_id))
+                               % (pd_count - len(pds), pd_kind, mr.ctrl_id))
             else:
-                self.log.info("Number of UGood HDD PD's available is %d on "
-                              "controller:%d" % (len(pds), mr.ctrl_id))
-        for mr in self.mrs:
-            self.vds = []
+                self.log.info("Number of UGood %s PD's available is %d on "
+                              "controller:%d"
+                              % (pd_kind, len(pds), mr.ctrl_id))
+
+        def create_vds(mr):
             self.log.info("Create R0, R1, R5 with diff properties on "
                           "Controller: %d" % (mr.ctrl_id))
-            self.vds.append(mr.cli.add_vd(raid=0, vd_size="3000MB",
-                                          WB="WB", RA='ra', cache="direct"))
-            self.vds.append(mr.cli.add_vd(raid=1, vd_size="3000MB",
-                                          WB="WT", RA='nora', cache="cached"))
-            self.vds.append(mr.cli.add_vd(raid=5, vd_size="3000MB",
-                                          WB="WB", RA='ra', cache="direct"))
-            for vd in self.vds:
-                while True:
-                    time.sleep(5)
-                    if (mr.cli.init_progress(vd) == -1):
-                        self.log.info("FGI completed for VD:%s"
-                                      % (vd))
-                        break
-            for vd in self.vds:
-                if mr.cli.vd_get_info(vd)['state'] != 'OPTL':
+            return [mr.cli.add_vd(**spec) for spec in self.VD_SPECS]
+
+        ctrl_vds = self.for_each_adapter(create_vds)
+
+        def fgi_running(mr_vd):
+            (mr, vd) = mr_vd
+            return mr.cli.init_progress(vd) != -1
+
+        def fgi_done(mr_vd):
+            (mr, vd) = mr_vd
+            self.log.info("FGI completed for VD:%s on controller: %d"
+                          % (vd, mr.ctrl_id))
+
+        def vd_name(mr_vd):
+            (mr, vd) = mr_vd
+            return "VD:%s on controller: %d" % (vd, mr.ctrl_id)
+
+        # wait up to 1h for FGI of every VD on every controller, in one
+        # pass per tick
+        self.wait_all_done(
+            "FGI on all controllers",
+            [(mr, vd) for (mr, vds) in zip(self.mrs, ctrl_vds) for vd in vds],
+            is_running=fgi_running, timeout=3600, on_done=fgi_done,
+            describe=vd_name)
+
+        def verify_vds(mr):
+            vds = ctrl_vds[self.mrs.index(mr)]
+            for vd in vds:
+                vd_info = mr.cli.vd_get_info(vd)
+                if vd_info['state'] != 'OPTL':
                     raise SALError("RAID-%s VD%s is not optimal"
-                                   % (mr.cli.vd_get_info(vd)['raid'], vd))
+                                   % (vd_info['raid'], vd))
                 else:
-                    self.log.info("RAID-%s VD%s is optimal"
-                                  % (mr.cli.vd_get_info(vd)['raid'], vd))
-
-            self.mr_vds.extend(self.vds)
+                    self.log.info("RAID-%s VD%s is optimal on controller: %d"
+                                  % (vd_info['raid'], vd, mr.ctrl_id))
             self.log.info("Created R0, R1, R5 successfully on controller: %d"
                           % (mr.ctrl_id))
 
+        self.for_each_adapter(verify_vds)
+        self.mr_vds = ctrl_vds  # VD ids per controller, in self.mrs order
+
     def step3(self):
         """ Display the cache flush time  of each controller one at a time"""
         for mr in self.mrs:
@@ -245,10 +314,10 @@ class SalTestCase(TestScript):
         for indx, mr in enumerate(self.mrs):
             self.log.info("Set boot drive on controller:%d"
                           % (mr.ctrl_id))
+            boot_vd = int(mr.cli.bootdrive_vd_get())
             for vd in self.mr_vds[indx]:
-                if (int(mr.cli.bootdrive_vd_get()) != vd):
-                    mr.cli.bootdrive_vd_set(vd_id=self.mr_vds[indx][indx],
-                                            setting="On")
+                if (boot_vd != vd):
+                    mr.cli.bootdrive_vd_set(vd_id=vd, setting="On")
                     break
 
     def step8(self):
@@ -263,9 +332,20 @@ class SalTestCase(TestScript):
             else:
                 self.log.info("Verified VD ID: %d of the boot VD on "
                               "controller: %d" % (int(vd_id), mr.ctrl_id))
-        for vd in self.mr_vds:
-            self.mrs[0].cli.delete_vd(vd_id=vd)
-        time.sleep(30)
+
+        def delete_vds(mr):
+            vds = self.mr_vds[self.mrs.index(mr)]
+            for vd in vds:
+                mr.cli.delete_vd(vd_id=vd)
+            # wait up to 30 secs for the VDs to leave the configuration
+            if not self.wait_until(
+                    "VD deletion on controller: %d" % (mr.ctrl_id),
+                    lambda: not set(vds) & set(v.id for v in mr.get_vds()),
+                    timeout=30, poll=2):
+                raise SALError("Failed to delete VD's on controller: %d"
+                               % (mr.ctrl_id))
+
+        self.for_each_adapter(delete_vds)
         self.log.info("Deleted all VD's succesfully")
 
 if __name__ == '__main__':
@@ -21,6 +21,12 @@
 # parameter as #python SCGCQ00539214.py --ctrl=<ctrl_index> --nocq
 #                                       --quarch_ip=<quarch-device-ip>
 # Ex: #python SCGCQ00539214.py --ctrl=0 --nocq --quarch_ip="135.24.231.85"
+# Optional: --io_target=<OS block device of the VD, or a file standing in
+#           for it> runs random 4K O_DIRECT I/O during the first (R1)
+#           rebuild in step5 and logs IOPS, MB/s and latency. A target
+#           whose size is not that of the 25GB VD step3 creates is refused.
+#           --io_read_pct=<0-100> (default 100, i.e. read only); anything
+#           below 100 WRITES to the target.
 #
 # Note: Ping to quarch connector, connect 4 ribbon cable from quarch to
 # PDs before starting the script.
@@ -90,22 +96,35 @@ import time
 
 from sal.mradapter import create_mradapter
 from sal.testscript import TestScript, arg
+from sal.storelib_defines import GB
 from sal import quarch, system
 from sal.common import SALError
 from sal.mraen import *
+from script_helpers import ScriptHelpers
 
 
-class SalTestCase(TestScript):
+class SalTestCase(ScriptHelpers, TestScript):
 
     """Verification of events for PD and LD related operations in Vivaldi and
     StoreLibTest"""
+    RESOURCES = {'pd_count': 6, 'enclosures': 1, 'quarch_modules': 3,
+                 'interface': 'sas', 'sector_size': '512B'}
+    VD_SIZE_GB = 25  # size of the R1/R1E step3 creates
     REQ_ARGS = [arg("--ctrl", dest="ctrl", type="int", help="ctrl ID number"),
                 arg("--quarch_ip", dest="quarch_ip", type="str",
                     help="Quarch IP address")]
+    OPT_ARGS = [arg("--io_target", dest="io_target", type="str",
+                    help="Block device or file to load during rebuild"),
+                arg("--io_read_pct", dest="io_read_pct", type="int",
+                    help="Read percentage of the I/O load (default 100)")]
 
     def init(self):
         """ create mr adapter instance"""
         self.mr = create_mradapter(ctrl_index=self.args.ctrl, test_script=self)
+        self.init_aen_tracking()
+        self.qrch = None  # Quarch connection, shared by steps and teardown
+        self.io_load_ran = False  # --io_target is only loaded once
+        self.all_pds_in = None  # PD count with every dtab powered up
 
         self.raid = 1  # This will be used in step3
         self.pd_count = 1  # This will be used in step3
@@ -113,22 +132,60 @@ class SalTestCase(TestScript):
     def teardown(self):
         """ Clean up VDs and PDs on a failure """
         try:
+            # the step2 connection may have dropped since, open a new one
+            self.quarch_connect(fresh=True)
+            self.power_dtabs(up=True)  # Make sure all PDs are pushed in
+            if self.all_pds_in is None:
+                time.sleep(30)
+            else:
+                self.wait_until(
+                    "all PDs back in",
+                    lambda: self.get_pd_count() >= self.all_pds_in,
+                    timeout=30)
+            self.qrch.comm_obj.close()
+        except Exception as err:
+            self.log.info("Failed to power up the dtab PDs: %s" % (err))
+
+        if self.io_load is not None:
+            self.stop_io_load()
+        self.stop_aen_waiters()
+        self.mr.restore_pretest(pretest=self.pretest_info)
+
+    def quarch_connect(self, fresh=False):
+        """ Open the Quarch connection on first use and reuse it for every
+        step. fresh=True closes the cached connection and opens a new one.
+        Returns the dtab modules """
+        if fresh and self.qrch is not None:
+            try:
+                self.qrch.comm_obj.close()
+            except Exception:
+                pass  # the old connection may already be gone
+            self.qrch = None
+        if self.qrch is None:
             self.qrch = quarch.TorridonController(
                 ip_address=self.args.quarch_ip)
             self.mod_list = self.qrch.get_modules()
             self.q_list = system.filter_devices(self.mod_list, type='dtab')
-        except Exception:
-            pass
-        try:
-            for dtab in self.q_list:  # Make sure all PDs are pushed in
-                dtab.power(up=True)
-                time.sleep(1)
-            time.sleep(30)
-            self.qrch.comm_obj.close()
-        except Exception:
-            pass
+        return self.q_list
 
-        self.mr.restore_pretest(pretest=self.pretest_info)
+    def power_dtabs(self, up):
+        """ Power all dtab modules down or up over the shared Quarch
+        connection, 1 sec apart so drives don't spin up at once """
+        for dtab in self.q_list:
+            dtab.power(up=up)
+            time.sleep(1)
+
+    def diff_pds(self, before, after):
+        """ Compare two PD enumerations by PD id in linear time and return
+        (added, removed) PD lists """
+        before_ids = set(pd.id for pd in before)
+        after_ids = set(pd.id for pd in after)
+        return ([pd for pd in after if pd.id not in before_ids],
+                [pd for pd in before if pd.id not in after_ids])
+
+    def get_pd_count(self, **kwargs):
+        """ Number of PDs currently seen by the controller """
+        return len(self.mr.get_all_pds(**kwargs))
 
     def step1(self):
         '''Log-in Vivaldi GUI. Open StoreLibTest as well.
@@ -142,36 +199,25 @@ class SalTestCase(TestScript):
         self.mr.set_ctrl_property(restoreHotSpareOnInsertion=1)
         if self.mr.get_ctrl_property()['disableAutoRebuild'] == 1:
             self.mr.set_ctrl_property(disableAutoRebuild=0)
-        time.sleep(30)  # sleep for 30sec
-        if self.mr.get_ctrl_property()['disableAutoRebuild'] != 0:
-            raise SALError("'disableAutoRebuild' is set to 1")
-        else:
-            self.log.info("'disableAutoRebuild' is set to 0")
+            # wait up to 30sec for the property to be applied
+            self.wait_until(
+                "disableAutoRebuild cleared",
+                lambda: self.mr.get_ctrl_property()['disableAutoRebuild'] == 0,
+                timeout=30, poll=2)
 
         # get controller properties from sl and cli
-        ctrl_prop_sl = self.mr.get_ctrl_property()
-        ctrl_prop_cli = self.mr.cli.get_all()
-
-        if ctrl_prop_sl['BIOS'].upper() != ctrl_prop_cli['bios_version'].upper():
-            raise SALError("Failed to match bios_version!")
+        (ctrl_prop_sl, ctrl_prop_cli) = self.get_ctrl_props()
+        if ctrl_prop_sl['disableAutoRebuild'] != 0:
+            raise SALError("'disableAutoRebuild' is set to 1")
         else:
-            self.log.info("bios_version: %s" % ctrl_prop_sl['BIOS'])
-
-        keys_sl = ['pci_subDevId', 'pci_subVendorId', 'pci_vendorId']
-        keys_cli = ['subdevice_id', 'subvendor_id', 'vendor_id']
-
-        self.log.info("*****Display details about devieID, etc*****")
-        for (key1, key2) in zip(keys_sl, keys_cli):
-            # convert hex to decimal and then str to compare with SL values
-            if ctrl_prop_sl[key1] != str(int(ctrl_prop_cli[key2], 16)):
-                raise SALError("Failed to match %s" % key1)
-            else:
-                self.log.info("%s : %s" % (key1, ctrl_prop_sl[key1]))
+            self.log.info("'disableAutoRebuild' is set to 0")
 
-        if ctrl_prop_sl['productName'].upper() != ctrl_prop_cli['model'].upper():
-            raise SALError("Failed to match product name!")
-        else:
-            self.log.info("Product name: %s" % ctrl_prop_sl['productName'])
+        self.log.info("*****Cross check SL and CLI controller info*****")
+        mismatches = self.cross_check(self.CTRL_PROP_CHECKS, ctrl_prop_sl,
+                                      ctrl_prop_cli)
+        if mismatches:
+            raise SALError("Failed to match %s" % ", ".join(
+                "%s (sl: %s, cli: %s)" % mismatch for mismatch in mismatches))
 
         self.log.info("*****Display full controller info*****")
         for key, val in iter(sorted(ctrl_prop_sl.iteritems())):
@@ -182,26 +228,33 @@ class SalTestCase(TestScript):
         Step Expected Result: StoreLibTest should show up events for the same.
         MSM monitor should throw events about PD"s been inserted and GUI should
         refresh on inserting the PD"s.'''
-        proc_pd_insert = self.mr.wait_for_event(
-            event_id=MR_EVT_PD_INSERTED, background=True)
+        proc_pd_insert = self.register_event(event_id=MR_EVT_PD_INSERTED)
         time.sleep(6)  # sleep for 6 sec
-        self.qrch = quarch.TorridonController(ip_address=self.args.quarch_ip)
-        self.mod_list = self.qrch.get_modules()
-        self.q_list = system.filter_devices(self.mod_list, type='dtab')
+        if len(self.quarch_connect()) < self.RESOURCES['quarch_modules']:
+            raise SALError("Only %d Quarch dtab modules found, %d required"
+                           % (len(self.q_list),
+                              self.RESOURCES['quarch_modules']))
+        pd_cnt = self.get_pd_count()
 
         # Make sure all PDs are pushed out
-        for dtab in self.q_list:
-            dtab.power(up=False)
-            time.sleep(1)
-        time.sleep(30)
+        self.power_dtabs(up=False)
+        self.wait_until(
+            "dtab PDs removed",
+            lambda: self.get_pd_count() <= pd_cnt - len(self.q_list),
+            timeout=30)
+        pd_cnt = self.get_pd_count()
 
         # Make sure all PDs are pushed in
-        for dtab in self.q_list:
-            dtab.power(up=True)
-            time.sleep(1)
-        time.sleep(30)
-
-        if proc_pd_insert.is_alive():  # check for pds insert aen
+        self.mark_action("dtab power up", proc_pd_insert)
+        self.power_dtabs(up=True)
+        self.wait_until(
+            "dtab PDs inserted and their AEN",
+            lambda: (proc_pd_insert in self.aen_done and
+                     self.get_pd_count() >= pd_cnt + len(self.q_list)),
+            timeout=30)
+        self.all_pds_in = self.get_pd_count()
+
+        if not self.event_found(proc_pd_insert, timeout=0):  # pds insert aen
             raise SALError("AEN for PDs insert was not found")
         else:
             self.log.info("AEN for PDs insert was found")
@@ -209,64 +262,56 @@ class SalTestCase(TestScript):
     def step3(self):
         """R1 is created without any error. Events related to it should be
         thrown in both MSM and StoreLibTest"""
-        proc_create = self.mr.wait_for_event(
-            event_id=MR_EVT_LD_CREATED, background=True)
-        proc_optimal = self.mr.wait_for_event(
-            event_id=MR_EVT_LD_OPTIMAL, background=True)
-        proc_init = self.mr.wait_for_event(
-            event_id=MR_EVT_LD_INIT_SUCCESSFUL, background=True)
-        proc_state = self.mr.wait_for_event(
-            event_id=MR_EVT_PD_STATE_CHANGE, background=True)
+        proc_create = self.register_event(event_id=MR_EVT_LD_CREATED)
+        proc_optimal = self.register_event(event_id=MR_EVT_LD_OPTIMAL)
+        proc_init = self.register_event(event_id=MR_EVT_LD_INIT_SUCCESSFUL)
+        proc_state = self.register_event(event_id=MR_EVT_PD_STATE_CHANGE)
         time.sleep(30)  # sleep for 30 sec
 
         # Drive group 1
+        pd_cnt = self.get_pd_count()
         self.q_list[0].power(up=False)
-        time.sleep(10)
+        self.wait_until("dtab 0 PD removed",
+                        lambda: self.get_pd_count() < pd_cnt,
+                        timeout=10, poll=2)
         dg1 = self.mr.get_pds(pd_count=self.pd_count, is_sas=True)
         pds_after_pull = self.mr.get_all_pds()
         self.q_list[0].power(up=True)
-        time.sleep(30)
-        all_pds = self.mr.get_all_pds()
-        for pd in all_pds:
-            for after_pd in pds_after_pull:
-                if pd.id == after_pd.id:
-                    break
-            else:
-                break  # Found
-        self.pd = pd  # will be used in step5
-        dg1.append(pd)
+        self.wait_until("dtab 0 PD inserted",
+                        lambda: self.get_pd_count() == pd_cnt, timeout=30)
+        (added, _) = self.diff_pds(pds_after_pull, self.mr.get_all_pds())
+        if not added:
+            raise SALError("Failed to find the reinserted PD")
+        self.pd = added[0]  # will be used in step5
+        dg1.append(self.pd)
+        self.mark_action("add_vd", proc_create, proc_init, proc_state,
+                         proc_optimal)
         self.vd = self.mr.add_vd(
-            raid=self.raid, pd_list=dg1, absolute_space="25GB", init_state=1)
+            raid=self.raid, pd_list=dg1,
+            absolute_space="%dGB" % (self.VD_SIZE_GB), init_state=1)
 
-        for _ in xrange(24):  # wait for 2m for aen, if not raise Error
-            if proc_create.is_alive():  # check for vd create aen
-                time.sleep(5)
-            else:
-                self.log.info("AEN for VD created found")
-                self.log.info("VD ID: %d, raid: %s" %
-                              (self.vd.id, self.vd.raid_level))
-                break  # break if aen found
-        else:
-            proc_optimal.terminate()
+        # wait for 2m for vd create aen, if not raise Error
+        if not self.event_found(proc_create, timeout=120):
             raise SALError("AEN for VD created was not found")
-        time.sleep(15)  # sleep for 15 sec
-
-        for _ in xrange(24):  # wait for 2m for aen, if not raise Error
-            if proc_init.is_alive():  # check for init complete aen
-                time.sleep(5)
-            else:
-                self.log.info("AEN for VD fast init found")
-                break  # break if aen found
         else:
+            self.log.info("AEN for VD created found")
+            self.log.info("VD ID: %d, raid: %s" %
+                          (self.vd.id, self.vd.raid_level))
+
+        # wait for 2m for init complete aen, if not raise Error
+        if not self.event_found(proc_init, timeout=120):
             raise SALError("AEN for VD fast init successful was not found")
+        else:
+            self.log.info("AEN for VD fast init found")
 
-        if proc_state.is_alive():  # check for pd state change aen
+        # check for pd state change aen
+        if not self.event_found(proc_state, timeout=15):
             raise SALError("AEN for PD state change was not found")
         else:
             self.log.info("AEN for PD state change is found")
 
-        if proc_optimal.is_alive():  # check VD state optimal aen
-            proc_create.terminate()
+        # check VD state optimal aen
+        if not self.event_found(proc_optimal, timeout=15):
             raise SALError("AEN for VD optimal was not found")
         else:
             self.log.info("AEN for VD optimal found")
@@ -284,20 +329,20 @@ class SalTestCase(TestScript):
         show up events for the State change of the VD.
         MSM GUI should also get refreshed
         """
-        self.proc_state = self.mr.wait_for_event(
-            event_id=MR_EVT_PD_STATE_CHANGE, background=True)
-        self.proc_deg = self.mr.wait_for_event(
-            event_id=MR_EVT_LD_DEGRADED, background=True)
+        self.proc_state = self.register_event(event_id=MR_EVT_PD_STATE_CHANGE)
+        self.proc_deg = self.register_event(event_id=MR_EVT_LD_DEGRADED)
         time.sleep(12)
+        self.mark_action("dtab power down", self.proc_deg, self.proc_state)
         self.q_list[0].power(up=False)  # Pull out one of the PD from R1
-        time.sleep(10)
 
-        if self.proc_deg.is_alive():  # check for VD degrade aen
+        # check for VD degrade aen
+        if not self.event_found(self.proc_deg, timeout=10):
             raise SALError("AEN for VD degrade was not found")
         else:
             self.log.info("AEN for VD degrade was found")
 
-        if self.proc_state.is_alive():  # check for pd state change aen
+        # check for pd state change aen
+        if not self.event_found(self.proc_state, timeout=10):
             raise SALError("AEN for PD state change was not found")
         else:
             self.log.info("AEN for PD state change is found")
@@ -313,26 +358,39 @@ class SalTestCase(TestScript):
         Step Expected Result: PD should rebuild to completion.
         MSM and StoreLibTest should throw corresponding events.
         """
-        self.proc_rbld = self.mr.wait_for_event(
-            event_id=MR_EVT_PD_RBLD_START_AUTO, pd=self.pd, background=True)
-        self.proc_rbld_dn = self.mr.wait_for_event(
-            event_id=MR_EVT_PD_RBLD_DONE_PD, background=True)
-        self.proc_optimal = self.mr.wait_for_event(
-            event_id=MR_EVT_LD_OPTIMAL, background=True)
+        self.proc_rbld = self.register_event(
+            event_id=MR_EVT_PD_RBLD_START_AUTO, pd=self.pd)
+        self.proc_rbld_dn = self.register_event(
+            event_id=MR_EVT_PD_RBLD_DONE_PD)
+        self.proc_optimal = self.register_event(event_id=MR_EVT_LD_OPTIMAL)
+        # foreground I/O during the rebuild. --io_target names the first
+        # pass's VD: step9's clear_config() deletes it and its OS name may
+        # then belong to another disk, so the R1E pass is not loaded
+        if self.args.io_target is not None and not self.io_load_ran:
+            self.io_load_ran = True
+            self.start_io_load(self.args.io_target, self.VD_SIZE_GB * GB,
+                               read_pct=(100 if self.args.io_read_pct is None
+                                         else self.args.io_read_pct))
+        elif self.args.io_target is not None:
+            self.log.info("Skip I/O load, %s named the VD cleared in step9"
+                          % (self.args.io_target))
         time.sleep(20)  # sleep for 20 sec
 
         # Pull in the PD which was pulled out earlier
+        pd_cnt = self.get_pd_count()
+        self.mark_action("dtab power up", self.proc_rbld)
         self.q_list[0].power(up=True)
-        time.sleep(10)
+        self.wait_until("dtab 0 PD inserted",
+                        lambda: self.get_pd_count() > pd_cnt,
+                        timeout=10, poll=2)
         if self.mr.scan_foreign_config() > 0:
             self.mr.clear_foreign_config()
-            time.sleep(30)
 
-        for _ in range(24):
-            time.sleep(5)
-            if self.pd.get_progress_rebuild() != -1:
-                self.log.info("Rebuild kicks in automatically")
-                break
+        # wait up to 2.5m for the auto rebuild to start
+        if self.wait_until("auto rebuild start on PD: %d" % (self.pd.id),
+                           lambda: self.pd.get_progress_rebuild() != -1,
+                           timeout=150):
+            self.log.info("Rebuild kicks in automatically")
         else:
             raise SALError("Rebuild do not kick in automatically!")
 
@@ -349,24 +407,26 @@ class SalTestCase(TestScript):
         else:
             self.log.info("Rebuild kicks in automatically")
 
-        for _ in range(24):
-            if self.proc_rbld.is_alive():  # check for rebuild start aen
-                time.sleep(5)
-            else:
-                self.log.info("AEN for PD rebuild auto start was found.")
-                break
-        else:
+        # wait for 2m for rebuild start aen
+        if not self.event_found(self.proc_rbld, timeout=120):
             raise SALError("AEN for PD rebuild auto start wasn't found!")
-
-        while True:  # Monitor rebuild progress
-            prog = self.pd.get_progress_rebuild()
-            if prog != -1:
-                time.sleep(10)
+        else:
+            self.log.info("AEN for PD rebuild auto start was found.")
+
+        # Monitor rebuild progress. R1 and R1E keep two copies of the VD
+        # spread over its PDs, that share of the VD is what gets rebuilt
+        for (prog, mbps, eta) in self.watch_rebuild(
+                self.pd, done_proc=self.proc_rbld_dn,
+                size=self.VD_SIZE_GB * GB * 2 / len(pds)):
+            if eta is None:
                 self.log.info("PD ID: %d, rebuild progress: %d"
                               % (self.pd.id, prog))
             else:
-                self.log.info("Rebuild is completed successfully")
-                break  # break from while when rebuild is done
+                self.log.info("PD ID: %d, rebuild progress: %d, %.1f MB/s, "
+                              "ETA: %d secs" % (self.pd.id, prog, mbps, eta))
+        self.log.info("Rebuild is completed successfully")
+        if self.io_load is not None:
+            self.stop_io_load()
 
         time.sleep(5)  # sleep for 5s
         # check rebuild done or not through cli
@@ -375,21 +435,19 @@ class SalTestCase(TestScript):
         else:
             self.log.info("Rebuild is completed successfully")
 
-        for _ in range(24):
-            if self.proc_rbld_dn.is_alive():  # check for rebuild done aen
-                time.sleep(5)
-            else:
-                self.log.info("AEN for PD rebuild done is found!")
-                break
-        else:
+        # wait for 2m for rebuild done aen
+        if not self.event_found(self.proc_rbld_dn, timeout=120):
             raise SALError("AEN for PD rebuild done wasn't found!")
+        else:
+            self.log.info("AEN for PD rebuild done is found!")
 
     def step6(self):
         '''Step Details: On Rebuild completion check for LD state change
         Expected Result:MSM should automatically refresh the State change of LD
         Events related to same should be seen in both MSM and StoreLibTest.'''
 
-        if self.proc_optimal.is_alive():  # check VD state optimal aen
+        # check VD state optimal aen
+        if not self.event_found(self.proc_optimal, timeout=15):
             raise SALError("AEN for VD optimal was not found")
         else:
             self.log.info("AEN for VD optimal found")
@@ -405,31 +463,36 @@ class SalTestCase(TestScript):
         Expected Result: GlobalHotSpare can be created without any hassles.
         MSM monitor and StoreLibTest should show events for the same.
         '''
-        proc_ghs = self.mr.wait_for_event(
-            event_id=MR_EVT_PD_SPARE_GLOBAL_CREATED, background=True)
+        proc_ghs = self.register_event(event_id=MR_EVT_PD_SPARE_GLOBAL_CREATED)
         time.sleep(6)  # sleep for 6 sec
+        pd_cnt = self.get_pd_count(state='unconfigured_good')
         self.q_list[1].power(up=False)
-        time.sleep(10)
+        self.wait_until(
+            "dtab 1 PD removed",
+            lambda: self.get_pd_count(state='unconfigured_good') < pd_cnt,
+            timeout=10, poll=2)
         pds_after_pull = self.mr.get_all_pds(state='unconfigured_good')
         self.q_list[1].power(up=True)
-        time.sleep(30)
-        all_pds = self.mr.get_all_pds(state='unconfigured_good')
-        for pd in all_pds:
-            for after_pd in pds_after_pull:
-                if pd.id == after_pd.id:
-                    break
-            else:
-                break  # Found
-        self.pd_ghs = pd
+        self.wait_until(
+            "dtab 1 PD inserted",
+            lambda: self.get_pd_count(state='unconfigured_good') == pd_cnt,
+            timeout=30)
+        (added, _) = self.diff_pds(
+            pds_after_pull, self.mr.get_all_pds(state='unconfigured_good'))
+        if not added:
+            raise SALError("Failed to find the reinserted PD")
+        self.pd_ghs = added[0]
+        self.mark_action("make_hotspare", proc_ghs)
         self.pd_ghs.make_hotspare()
-        time.sleep(5)
 
-        if self.pd_ghs.state != 'hot_spare':
+        if not self.wait_until("GHS on PD: %d" % (self.pd_ghs.id),
+                               lambda: self.pd_ghs.state == 'hot_spare',
+                               timeout=5, poll=1):
             raise SALError("Failed to create GHS!")
         else:
             self.log.info("GHS created on PD:%s" % self.pd_ghs.id)
 
-        if proc_ghs.is_alive():  # check ghs aen
+        if not self.event_found(proc_ghs, timeout=5):  # check ghs aen
             raise SALError("AEN for GHS created was not found")
         else:
             self.log.info("AEN for GHS created found")
@@ -445,23 +508,21 @@ class SalTestCase(TestScript):
         Expected Result:Both the Events have to be displayed in MSM monitor and
         StoreLibTest. MSM GUI should also get refreshed.
         '''
-        proc_state = self.mr.wait_for_event(
-            event_id=MR_EVT_PD_STATE_CHANGE, background=True)
-        proc_ghs = self.mr.wait_for_event(
-            event_id=MR_EVT_PD_SPARE_GLOBAL_CREATED, background=True)
+        proc_state = self.register_event(event_id=MR_EVT_PD_STATE_CHANGE)
+        proc_ghs = self.register_event(event_id=MR_EVT_PD_SPARE_GLOBAL_CREATED)
         time.sleep(12)  # sleep for 12 sec
+        self.mark_action("dtab power down", proc_state)
         self.q_list[1].power(up=False)  # disconnect GHS PD
-        time.sleep(10)
 
-        if proc_state.is_alive():  # check ghs pd state aen
+        if not self.event_found(proc_state, timeout=10):  # ghs pd state aen
             raise SALError("AEN for PD state change was not found")
         else:
             self.log.info("AEN for PD state change found")
 
+        self.mark_action("dtab power up", proc_ghs)
         self.q_list[1].power(up=True)  # reconnect the GHS PD
-        time.sleep(20)
 
-        if proc_ghs.is_alive():  # check ghs aen
+        if not self.event_found(proc_ghs, timeout=20):  # check ghs aen
             raise SALError("AEN for GHS created was not found")
         else:
             self.log.info("AEN for GHS created found")
@@ -472,24 +533,22 @@ class SalTestCase(TestScript):
         Expected Result: StoreLibTest and hence MSM monitor should show up the
         event for the same.
         '''
-        proc_clear = self.mr.wait_for_event(
-            event_id=MR_EVT_CFG_CLEARED, background=True)
+        proc_clear = self.register_event(event_id=MR_EVT_CFG_CLEARED)
         time.sleep(6)  # sleep for 6 sec
+        self.mark_action("clear_config", proc_clear)
         self.mr.clear_config()  # clear the config
-        time.sleep(5)
-        if len(self.mr.get_vds()) != 0:
+        if not self.wait_until("cleared configuration",
+                               lambda: len(self.mr.get_vds()) == 0,
+                               timeout=5, poll=1):
             raise SALError("Failed to clear the configuration!")
         else:
             self.log.info("Cleared the configuration successfully")
 
-        for _ in xrange(120):  # wait for 10m for aen, if not raise Error
-            if proc_clear.is_alive():  # check for clear config aen
-                time.sleep(5)
-            else:
-                self.log.info("AEN for clear config was found")
-                break  # break if aen found
-        else:
+        # wait for 10m for clear config aen, if not raise Error
+        if not self.event_found(proc_clear, timeout=600):
             raise SALError("AEN for clear config was not found")
+        else:
+            self.log.info("AEN for clear config was found")
 
         self.raid = 11  # This will be used in step3
         self.pd_count = 3  # This will be used in step3
@@ -506,18 +565,21 @@ class SalTestCase(TestScript):
         Step Expected Result: MSM monitor logs should show up the events about
         the same and the GUI should get refreshed. StoreLibTest also should
         show up the PD removal events.'''
-        proc_pd_rem = self.mr.wait_for_event(
-            event_id=MR_EVT_PD_REMOVED, background=True)
+        proc_pd_rem = self.register_event(event_id=MR_EVT_PD_REMOVED)
         time.sleep(6)  # sleep for 6 sec
         self.log.info("Delete the above created VD: %d" % self.vd.id)
         self.vd.delete()
+        pd_cnt = self.get_pd_count()
         # Make sure all PDs are pushed out
-        for dtab in self.q_list:
-            dtab.power(up=False)
-            time.sleep(1)
-        time.sleep(30)
-
-        if proc_pd_rem.is_alive():  # check PD state
+        self.mark_action("dtab power down", proc_pd_rem)
+        self.power_dtabs(up=False)
+        self.wait_until(
+            "dtab PDs removed and their AEN",
+            lambda: (proc_pd_rem in self.aen_done and
+                     self.get_pd_count() <= pd_cnt - len(self.q_list)),
+            timeout=30)
+
+        if not self.event_found(proc_pd_rem, timeout=0):  # check PD state
             raise SALError("AEN for PDs removal was not found")
         else:
             self.log.info("AEN for PDs removal found")
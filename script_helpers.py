@@ -0,0 +1,392 @@
+"""
+# Helpers shared by the SCGCQ test scripts in this directory: bounded
+# condition waits, background AEN waiters with latency reporting, rebuild
+# progress monitoring, SL vs CLI controller property checks and a random
+# I/O load generator for a VD's OS block device.
+#
+# Usage: class SalTestCase(ScriptHelpers, TestScript). The helpers use
+# self.log, and self.mr where they talk to the controller.
+"""
+
+import bisect
+import io
+import mmap
+import os
+import random
+import threading
+import time
+
+from sal.storelib_defines import KB, GB
+from sal.common import SALError
+
+
+class ScriptHelpers(object):
+
+    """ Mixin with the helpers shared by the SCGCQ test scripts """
+    # Hardware a test needs, in a form ATE/schedulers can read. Each
+    # script sets the keys that apply to it:
+    #   pd_count       - number of PDs
+    #   per_controller - True if every controller needs pd_count PDs
+    #   enclosures     - number of enclosures
+    #   quarch_modules - number of Quarch dtab modules, one PD on each
+    #   interface      - PD interface, 'sas' or 'sata'
+    #   media_type     - PD media, 'hdd' or 'ssd'
+    #   sector_size    - PD logical sector size, e.g. '512B'
+    # interface, media_type and sector_size describe all pd_count PDs, or
+    # only the dtab PDs when quarch_modules is set
+    RESOURCES = {}
+    AEN_LATENCY_BUCKETS = [1, 2, 5, 10, 30, 60, 120]  # secs
+    AEN_POLL = 0.2  # secs between checks of the background AEN waiters
+    IO_LATENCY_BUCKETS = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500,
+                          1000]  # ms
+    IO_SIZE_SLACK = 0.1  # I/O target size vs VD size, GB vs GiB and rounding
+    io_load = None  # (stop event, worker threads, stats) while a load runs
+    # SL vs CLI controller property checks:
+    # (sl key, cli key, sl value converter, cli value converter)
+    # pci ids: cli hex converted to a decimal str, SL value compared as is
+    CTRL_PROP_CHECKS = [
+        ('BIOS', 'bios_version', lambda v: v.upper(), lambda v: v.upper()),
+        ('pci_subDevId', 'subdevice_id', lambda v: v,
+         lambda v: str(int(v, 16))),
+        ('pci_subVendorId', 'subvendor_id', lambda v: v,
+         lambda v: str(int(v, 16))),
+        ('pci_vendorId', 'vendor_id', lambda v: v,
+         lambda v: str(int(v, 16))),
+        ('productName', 'model', lambda v: v.upper(), lambda v: v.upper())]
+
+    def wait_until(self, desc, predicate, timeout, poll=5, backoff=1,
+                   log=True):
+        """ Poll predicate until it returns True or timeout secs elapse.
+        Returns True if the condition was met, False on timeout. The time
+        spent waiting is logged under desc (what is waited for, with the
+        controller id where there is one) unless log is False """
+        start = time.time()
+        end = start + timeout
+        while True:
+            try:
+                if predicate():
+                    if log:
+                        self.log.info("Wait for %s done in %.1f of %d secs"
+                                      % (desc, time.time() - start, timeout))
+                    return True
+            except SALError:
+                pass  # controller may still be busy or resetting, poll again
+            remaining = end - time.time()
+            if remaining <= 0:
+                if log:
+                    self.log.info("Wait for %s timed out after %d secs"
+                                  % (desc, timeout))
+                return False
+            time.sleep(min(poll, remaining))
+            poll *= backoff
+
+    def wait_all_done(self, desc, items, is_running, timeout, on_done=None,
+                      describe=str, poll=5):
+        """ Track a background operation on several items at once. Every
+        still pending item is queried once per tick until is_running(item)
+        returns False for all of them. on_done(item) is called as each one
+        finishes. The time spent is logged under desc. Raises SALError
+        naming the items still pending (through describe) if they are not
+        all done within timeout secs """
+        start = time.time()
+        end = start + timeout
+        pending = list(items)
+        while pending:
+            for item in list(pending):
+                if not is_running(item):
+                    pending.remove(item)
+                    if on_done is not None:
+                        on_done(item)
+            if not pending:
+                break
+            remaining = end - time.time()
+            if remaining <= 0:
+                raise SALError("Wait for %s timed out after %d secs, still "
+                               "pending: %s" % (desc, timeout, ", ".join(
+                                   describe(item) for item in pending)))
+            time.sleep(min(poll, remaining))
+        self.log.info("Wait for %s on %d items done in %.1f secs"
+                      % (desc, len(items), time.time() - start))
+
+    def init_aen_tracking(self):
+        """ Set up the bookkeeping for background AEN waiters, call from
+        init() """
+        self.aen_procs = {}  # background AEN waiter -> event id
+        self.aen_marks = {}  # AEN waiter -> (triggering action, time)
+        self.aen_done = {}  # AEN waiter -> time it was seen done
+        self.aen_latency = {}  # event id -> latencies in secs
+        self.aen_stop = threading.Event()
+        self.aen_watcher = None
+
+    def register_event(self, **kwargs):
+        """ Start a background AEN waiter, tracked so that teardown can
+        stop any waiter still running when a step fails """
+        proc = self.mr.wait_for_event(background=True, **kwargs)
+        self.aen_procs[proc] = kwargs.get('event_id')
+        if self.aen_watcher is None:
+            self.aen_watcher = threading.Thread(target=self.watch_aens)
+            self.aen_watcher.daemon = True
+            self.aen_watcher.start()
+        return proc
+
+    def watch_aens(self):
+        """ Background thread noting when each AEN waiter is done, i.e. when
+        its event arrived, independent of when a step checks for it """
+        while not self.aen_stop.is_set():
+            for proc in list(self.aen_procs):
+                if proc not in self.aen_done and not proc.is_alive():
+                    self.aen_done[proc] = time.time()
+            self.aen_stop.wait(self.AEN_POLL)
+
+    def mark_action(self, action, *procs):
+        """ Note the SAL action that should trigger the AENs awaited by
+        procs. Their latency is measured from this point. A waiter whose
+        event already arrived is not marked, it gets no latency sample """
+        now = time.time()
+        for proc in procs:
+            if proc not in self.aen_done and proc.is_alive():
+                self.aen_marks[proc] = (action, now)
+
+    def stop_aen_waiters(self):
+        """ Stop the waiter watch and any AEN waiter still running, then
+        log the latencies collected so far. Called from teardown, so a
+        failed run still reports them """
+        self.aen_stop.set()
+        for proc in self.aen_procs:  # stop stray AEN waiters
+            if proc.is_alive():
+                proc.terminate()
+        self.log_aen_latency()
+
+    def log_aen_latency(self):
+        """ Log a latency histogram for every awaited event id """
+        for (event_id, secs) in sorted(self.aen_latency.iteritems()):
+            secs = sorted(secs)
+            limits = self.AEN_LATENCY_BUCKETS
+            buckets = [0] * (len(limits) + 1)
+            for sec in secs:
+                buckets[bisect.bisect_left(limits, sec)] += 1
+            self.log.info("AEN %s latency: n=%d min=%.1f p50=%.1f max=%.1f "
+                          "secs, histogram (<=%s secs, more): %s"
+                          % (event_id, len(secs), secs[0],
+                             secs[len(secs) // 2], secs[-1], limits, buckets))
+
+    def event_found(self, proc, timeout):
+        """ Wait up to timeout secs for a background AEN waiter to see its
+        event. Returns True once the event has arrived. If mark_action()
+        named the waiter, the time from that action until the waiter was
+        seen done is recorded as the event's latency, whatever ran in
+        between. Waiters are checked every AEN_POLL secs, so this is an
+        upper bound by that much """
+        event_id = self.aen_procs.get(proc)
+        if not self.wait_until("AEN %s" % (event_id),
+                               lambda: proc in self.aen_done, timeout,
+                               poll=self.AEN_POLL):
+            return False
+        if proc in self.aen_marks:
+            (action, start) = self.aen_marks.pop(proc)
+            latency = self.aen_done[proc] - start
+            self.aen_latency.setdefault(event_id, []).append(latency)
+            self.log.info("AEN %s arrived %.1f secs after %s"
+                          % (event_id, latency, action))
+        return True
+
+    def watch_rebuild(self, pd, done_proc=None, poll=10, max_poll=60,
+                      size=None):
+        """ Generator yielding (progress, MB/s, ETA secs) samples for the
+        rebuild running on pd until it completes. MB/s and ETA are None
+        until progress has moved. MB/s assumes the rebuild covers size
+        bytes, the extent of the VD on pd (default: the whole PD). The
+        poll interval follows the observed rate, and done_proc (a rebuild
+        done AEN waiter) ends the watch as soon as its event arrives """
+        size = pd.size if size is None else size
+        start = start_prog = None
+        interval = poll
+        while True:
+            prog = pd.get_progress_rebuild()
+            if prog == -1:
+                return  # rebuild is done
+            now = time.time()
+            if start_prog is None:
+                (start, start_prog) = (now, prog)
+            (mbps, eta) = (None, None)
+            if prog > start_prog:
+                pct_per_sec = (prog - start_prog) / (now - start)
+                mbps = pct_per_sec / 100 * size / GB * KB
+                eta = (100 - prog) / pct_per_sec
+                # sample about 20 more times over the remaining rebuild
+                interval = min(max(eta / 20, 1), max_poll)
+            yield (prog, mbps, eta)
+            if done_proc is None:
+                time.sleep(interval)
+            elif self.wait_until("rebuild done AEN",
+                                 lambda: done_proc in self.aen_done, interval,
+                                 poll=1, log=False):
+                return  # rebuild done AEN arrived
+
+    def get_ctrl_props(self):
+        """ Fetch the storelib and cli views of the controller properties
+        concurrently. Returns (ctrl_prop_sl, ctrl_prop_cli) """
+        cli_res = {}
+
+        def get_cli():
+            try:
+                cli_res['props'] = self.mr.cli.get_all()
+            except Exception as err:
+                cli_res['error'] = err
+
+        cli_thread = threading.Thread(target=get_cli)
+        cli_thread.start()
+        try:
+            ctrl_prop_sl = self.mr.get_ctrl_property()
+        finally:
+            cli_thread.join()
+        if 'error' in cli_res:
+            raise cli_res['error']
+        return (ctrl_prop_sl, cli_res['props'])
+
+    def cross_check(self, checks, vals_sl, vals_cli):
+        """ Compare the storelib and cli values named by each row of checks
+        in one pass. Returns (sl_key, sl value, cli value) for every
+        mismatch """
+        mismatches = []
+        for (key_sl, key_cli, conv_sl, conv_cli) in checks:
+            if conv_sl(vals_sl[key_sl]) != conv_cli(vals_cli[key_cli]):
+                mismatches.append((key_sl, vals_sl[key_sl], vals_cli[key_cli]))
+            else:
+                self.log.info("%s : %s" % (key_sl, vals_sl[key_sl]))
+        return mismatches
+
+    def start_io_load(self, path, vd_size, read_pct=100, block_size=4096,
+                      workers=4):
+        """ Start random block_size I/O on path (the VD's OS block device,
+        or a file standing in for it) from worker threads. read_pct of the
+        I/Os are reads, the rest WRITE to path. path is refused unless its
+        size is within IO_SIZE_SLACK of vd_size bytes, checked read only,
+        so a path naming another disk is never written to. Where the OS
+        has O_DIRECT the I/O bypasses the page cache, writes are O_SYNC
+        where it has that. stop_io_load() ends the run and logs the
+        results """
+        try:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                size = os.lseek(fd, 0, os.SEEK_END)
+            finally:
+                os.close(fd)
+        except OSError as err:
+            raise SALError("Failed to open I/O target %s: %s" % (path, err))
+        if abs(size - vd_size) > vd_size * self.IO_SIZE_SLACK:
+            raise SALError("I/O target %s is %d bytes, not the %d byte VD, "
+                           "refusing to load it" % (path, size, vd_size))
+        blocks = size // block_size
+        direct = hasattr(os, 'O_DIRECT')
+        flags = os.O_RDONLY if read_pct >= 100 else os.O_RDWR
+        if direct:
+            flags |= os.O_DIRECT
+        if read_pct < 100 and hasattr(os, 'O_SYNC'):
+            flags |= os.O_SYNC
+        # open the target here, so that a bad path fails the step instead
+        # of silently killing the workers
+        fds = []
+        try:
+            for _ in range(workers):  # one fd each, seek and I/O per worker
+                fds.append(os.open(path, flags))
+        except OSError as err:
+            for fd in fds:
+                os.close(fd)
+            raise SALError("Failed to open I/O target %s: %s" % (path, err))
+        stop = threading.Event()
+        lock = threading.Lock()
+        limits = self.IO_LATENCY_BUCKETS
+        stats = {'block_size': block_size, 'direct': direct, 'ios': 0,
+                 'hist': [0] * (len(limits) + 1), 'max': 0, 'errors': 0,
+                 'failed': [], 'start': time.time()}
+
+        def worker(fd):
+            # O_DIRECT needs an aligned buffer, mmap memory is page aligned
+            buf = mmap.mmap(-1, block_size)
+            buf.write(os.urandom(block_size))
+            dev = io.FileIO(fd, 'r', closefd=False)
+            try:
+                while not stop.is_set():
+                    os.lseek(fd, random.randrange(blocks) * block_size,
+                             os.SEEK_SET)
+                    start = time.time()
+                    try:
+                        if random.randrange(100) < read_pct:
+                            dev.readinto(buf)
+                        else:
+                            os.write(fd, buf)
+                    except (IOError, OSError):
+                        with lock:
+                            stats['errors'] += 1
+                        stop.wait(0.1)  # target may be gone, don't spin
+                        continue
+                    latency = (time.time() - start) * 1000  # ms
+                    with lock:
+                        stats['ios'] += 1
+                        stats['hist'][bisect.bisect_left(limits,
+                                                         latency)] += 1
+                        stats['max'] = max(stats['max'], latency)
+            except Exception as err:
+                with lock:
+                    stats['failed'].append(err)
+            finally:
+                buf.close()
+                os.close(fd)
+
+        threads = [threading.Thread(target=worker, args=(fd,)) for fd in fds]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        self.io_load = (stop, threads, stats)
+        self.log.info("Started %d%% read, %dB random %s I/O on %s with %d "
+                      "threads" % (read_pct, block_size,
+                                   "direct" if direct else "buffered", path,
+                                   workers))
+        return stats
+
+    def stop_io_load(self, timeout=30):
+        """ Stop the I/O started by start_io_load(), waiting up to timeout
+        secs for the workers, and log IOPS, MB/s and latency percentiles """
+        (stop, threads, stats) = self.io_load
+        self.io_load = None
+        stop.set()
+        end = time.time() + timeout
+        for thread in threads:
+            thread.join(max(end - time.time(), 0))
+        hung = len([thread for thread in threads if thread.is_alive()])
+        if hung:
+            self.log.info("%d I/O threads still blocked on the target after "
+                          "%d secs, leaving them behind" % (hung, timeout))
+        secs = time.time() - stats['start']
+        for err in stats['failed']:
+            self.log.info("I/O thread failed: %s" % (err))
+        if not stats['direct']:
+            self.log.info("No O_DIRECT on this OS, the I/O went through the "
+                          "page cache: the figures below do not measure the "
+                          "VD")
+        if not stats['ios']:
+            self.log.info("No I/O completed (%d errors)" % (stats['errors']))
+            return stats
+        limits = self.IO_LATENCY_BUCKETS
+
+        def percentile(frac):
+            """ Upper bound of the latency bucket holding frac of the I/Os,
+            as a str """
+            seen = 0
+            for (limit, count) in zip(limits + [None], stats['hist']):
+                seen += count
+                if seen >= frac * stats['ios']:
+                    break
+            return "<=%s" % (limit) if limit is not None else ">%s" % (
+                limits[-1])
+
+        self.log.info("I/O load: %d IOPS, %.1f MB/s, latency p50 %s ms, "
+                      "p99 %s ms, max %.2f ms, %d errors"
+                      % (stats['ios'] / secs,
+                         stats['ios'] * stats['block_size'] / float(GB) * KB
+                         / secs, percentile(0.5), percentile(0.99),
+                         stats['max'], stats['errors']))
+        self.log.info("I/O latency histogram (<=%s ms, more): %s"
+                      % (limits, stats['hist']))
+        return stats